@@ -1,10 +1,21 @@
-import requests
+import asyncio
+import functools
 import os
 import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+import httpx
+import numpy as np
+import orjson
+from numba import njit
+import redis.asyncio as redis
+from redis.exceptions import RedisError
 from fastapi import FastAPI
+from fastapi.responses import Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from datetime import datetime
+from time import monotonic, time as _now
 
 # Load environment variables
 load_dotenv()
@@ -12,27 +23,243 @@ load_dotenv()
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# httpx logs every request URL at INFO, and OpenWeather URLs carry the API key
+logging.getLogger("httpx").setLevel(logging.WARNING)
 
 # Fetch API key from environment variables
 OPENWEATHER_API_KEY = os.getenv("OPENWEATHER_API_KEY")
 if not OPENWEATHER_API_KEY:
     raise ValueError("Missing OPENWEATHER_API_KEY in .env file")
 
-app = FastAPI()
+# Maximum concurrent OpenWeather requests per worker, to stay within the plan's rate limit
+UPSTREAM_CONCURRENCY = 30
+
+# Query parameters sent with every OpenWeather request
+_BASE_PARAMS = {"appid": OPENWEATHER_API_KEY}
+
+# Everything this app writes to Redis expires, so the instance is expected to run with
+# an eviction policy such as "maxmemory-policy allkeys-lfu" set in its own config
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+# Cache lifetimes in seconds: weather changes within minutes, air quality within the hour
+WEATHER_TTL = 60
+AIR_QUALITY_TTL = 600
+# Serialized /check-weather responses expire with the weather data they were built from
+RESPONSE_TTL = WEATHER_TTL
+# How long the last good response is kept around as a fallback for upstream errors
+STALE_TTL = 24 * 60 * 60
+
+# Air quality matrix: one row of pollutant limits per category, columns in _POLLUTANTS order
+_POLLUTANTS = ("so2", "no2", "pm10", "pm2_5", "o3", "co")
+_CATEGORIES = ("Good", "Fair", "Moderate", "Poor", "Very Poor")
+_THRESH = np.array([
+    [20, 40, 20, 10, 60, 4400],
+    [80, 70, 50, 25, 100, 9400],
+    [250, 150, 100, 50, 140, 12400],
+    [350, 200, 200, 75, 180, 15400],
+    [np.inf] * 6,
+], dtype=np.float64)
+_POOR = _CATEGORIES.index("Poor")
+
+# Pet-walk recommendations in priority order as (recommendation, triggered_by, value) templates
+_TEMPERATURE_VALUE = "{temp_c:.2f}°C / Feels Like: {feels_like_c:.2f}°C"
+_RULES = (
+    ("Take Precaution (Air Quality: {aq})", "Air Pollution", "{aq}"),
+    ("Do Not Go Out (Extreme Temperature)", "Temperature", _TEMPERATURE_VALUE),
+    ("Do Not Go Out (High Wind Speed)", "Wind Speed", "{wind_kmh:.2f} km/h"),
+    ("Do Not Go Out (Heavy Rain/Snow)", "Precipitation", "{precipitation} mm"),
+    ("Take Precaution (Temperature Warning)", "Temperature", _TEMPERATURE_VALUE),
+    ("No Worries (Good Weather for a Walk)", "General Weather Conditions", "All parameters within safe range"),
+)
+
+# In-flight /check-weather fetches keyed by rounded (lat, lon)
+_inflight = {}
+
+@asynccontextmanager
+async def lifespan(app):
+    """Open and warm up the shared HTTP and Redis clients on startup, close them on shutdown."""
+    # Compile (or load the cached) classifier before the first request arrives
+    _classify(0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 20.0, 20.0, 0.0, 0.0)
+    # One pooled HTTP/2 connection to OpenWeather is reused across requests
+    app.state.client = httpx.AsyncClient(
+        base_url="https://api.openweathermap.org",
+        http2=True,
+        timeout=httpx.Timeout(3.0, connect=1.0),
+        limits=httpx.Limits(max_keepalive_connections=50),
+    )
+    # Created here rather than at import so it binds to the server's event loop on Python 3.9
+    app.state.upstream_sem = asyncio.Semaphore(UPSTREAM_CONCURRENCY)
+    # Short timeouts so an unreachable Redis shows up as a cache miss rather than a hung request
+    app.state.cache = cache = redis.from_url(REDIS_URL, socket_connect_timeout=0.2, socket_timeout=0.2)
+    # Open the TLS connection to OpenWeather now so the first user doesn't pay for the handshake
+    try:
+        await app.state.client.get("/data/2.5/weather", params={"lat": 0, "lon": 0, **_BASE_PARAMS})
+    except httpx.HTTPError as e:
+        logger.warning(f"⚠️ Could not warm up OpenWeather connection: {_describe_error(e)}")
+    try:
+        yield
+    finally:
+        await app.state.client.aclose()
+        await cache.close()
+
+app = FastAPI(lifespan=lifespan)
 
 class LocationData(BaseModel):
     lat: float
     lon: float
 
-def is_daytime(sunrise, sunset):
-    """Determine if it's currently daytime based on sunrise and sunset times."""
-    current_time = datetime.now().timestamp()
-    return sunrise <= current_time <= sunset
+@dataclass
+class WeatherResponse:
+    """Classification plus the fields needed by the WeatherCard component."""
+    # Declared by hand since dataclass(slots=True) needs Python 3.10
+    __slots__ = (
+        "recommendation", "triggered_by", "value", "location", "country", "temp", "feels_like",
+        "description", "main", "humidity", "wind_speed", "air_quality", "is_day", "stale",
+    )
+    recommendation: str
+    triggered_by: str
+    value: str
+    location: str
+    country: str
+    temp: float
+    feels_like: float
+    description: str
+    main: str
+    humidity: int
+    wind_speed: float
+    air_quality: str
+    is_day: bool
+    stale: bool
+
+class CircuitBreaker:
+    """Stop calling a failing upstream for a cool-down period after repeated failures."""
+
+    def __init__(self, max_failures, reset_after):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def is_open(self):
+        if self.opened_at is None:
+            return False
+        # Monotonic so a wall-clock step can't stretch or skip the cool-down
+        if monotonic() - self.opened_at < self.reset_after:
+            return True
+        # Cool-down is over: let calls through again, but reopen on the next failure
+        self.opened_at = None
+        self.failures = self.max_failures - 1
+        return False
+
+    def record_success(self):
+        self.failures = 0
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.opened_at = monotonic()
+
+# Shared by both OpenWeather endpoints since they live on the same upstream
+_breaker = CircuitBreaker(max_failures=5, reset_after=30)
+
+def cached(prefix, ttl):
+    """Cache a coordinate fetcher in Redis, keyed by (lat, lon) rounded to ~1 km.
+
+    A fetcher returns None when the upstream data is unusable. In that case, when
+    the request fails or returns an unreadable body, or while the circuit breaker
+    is open, the last good value is returned with ``stale=True`` instead.
+    """
+    def decorator(fetch):
+        @functools.wraps(fetch)
+        async def wrapper(lat, lon):
+            key = f"{prefix}:{round(lat, 2)}:{round(lon, 2)}"
+            hit = await _cache_get(key)
+            if hit is not None:
+                return orjson.loads(hit)
+
+            if _breaker.is_open:
+                logger.warning(f"⚠️ Circuit open, skipping upstream request for {key}")
+                return await _get_stale(key)
+
+            try:
+                data = await fetch(lat, lon)
+            except (httpx.HTTPError, orjson.JSONDecodeError) as e:
+                logger.warning(f"⚠️ Upstream request failed for {key}: {_describe_error(e)}")
+                _breaker.record_failure()
+                data = None
+
+            if data is None:
+                return await _get_stale(key)
+
+            body = orjson.dumps(data)
+            await _cache_set((key, ttl, body), (f"{key}:stale", STALE_TTL, body))
+            return data
+        return wrapper
+    return decorator
+
+async def _cache_get(key):
+    """Read raw bytes from Redis, treating Redis errors as a cache miss."""
+    try:
+        return await app.state.cache.get(key)
+    except RedisError as e:
+        logger.warning(f"⚠️ Redis read failed for {key}: {e}")
+        return None
+
+async def _cache_set(*entries):
+    """Write (key, ttl, body) entries to Redis in one round-trip, logging Redis errors."""
+    try:
+        async with app.state.cache.pipeline(transaction=False) as pipe:
+            for key, ttl, body in entries:
+                pipe.setex(key, ttl, body)
+            await pipe.execute()
+    except RedisError as e:
+        logger.warning(f"⚠️ Redis write failed for {entries[0][0]}: {e}")
+
+async def _get_stale(key):
+    """Return the last good value cached under key flagged as stale, or None."""
+    hit = await _cache_get(f"{key}:stale")
+    if hit is None:
+        return None
+    logger.info(f"Serving stale data for {key}")
+    return {**orjson.loads(hit), "stale": True}
+
+def _describe_error(e):
+    """Describe an upstream error for the log without its URL, which carries the API key."""
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"{type(e).__name__} {e.response.status_code}"
+    return type(e).__name__
+
+async def _fetch_json(path, params):
+    """GET an OpenWeather endpoint and decode its JSON body.
 
-def get_weather_data(lat, lon):
+    429 and 5xx answers raise httpx.HTTPStatusError so they count against the
+    circuit breaker; only 2xx answers reset it. Other 4xx answers (e.g. bad
+    coordinates) are returned as-is and leave the breaker untouched.
+    """
+    async with app.state.upstream_sem:
+        resp = await app.state.client.get(path, params=params)
+    if resp.status_code == 429 or resp.status_code >= 500:
+        resp.raise_for_status()
+    response = orjson.loads(resp.content)
+    if resp.is_success:
+        _breaker.record_success()
+    return response
+
+def _dig(data, *keys, default=None):
+    """Walk nested dicts/lists in an API response, returning default if any step is missing."""
+    for key in keys:
+        try:
+            data = data[key]
+        except (KeyError, IndexError, TypeError):
+            return default
+    return default if data is None else data
+
+@cached("wx", WEATHER_TTL)
+async def get_weather_data(lat, lon):
     """Fetch real-time weather data from OpenWeather API."""
-    url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-    response = requests.get(url).json()
+    params = {"lat": lat, "lon": lon, **_BASE_PARAMS}
+    response = await _fetch_json("/data/2.5/weather", params)
 
     logger.info(f"Fetching weather data for {lat}, {lon}")
 
@@ -40,142 +267,173 @@ def get_weather_data(lat, lon):
         logger.warning(f"⚠️ Error fetching weather data: {response.get('message')}")
         return None
 
-    rain = response.get("rain", {}).get("1h", 0)
-    snow = response.get("snow", {}).get("1h", 0)
+    rain = _dig(response, "rain", "1h", default=0)
+    snow = _dig(response, "snow", "1h", default=0)
 
-    # Get sunrise and sunset times
-    sunrise = response.get("sys", {}).get("sunrise", 0)
-    sunset = response.get("sys", {}).get("sunset", 0)
+    # Get sunrise and sunset times, used to tell whether it's currently daytime
+    sunrise = _dig(response, "sys", "sunrise", default=0)
+    sunset = _dig(response, "sys", "sunset", default=0)
     
     # Get location and country
     location = response.get("name", "Unknown")
-    country = response.get("sys", {}).get("country", "")
+    country = _dig(response, "sys", "country", default="")
     
     # Get weather description and main condition
-    weather_description = response.get("weather", [{}])[0].get("description", "Clear sky")
-    weather_main = response.get("weather", [{}])[0].get("main", "Clear")
+    weather_description = _dig(response, "weather", 0, "description", default="Clear sky")
+    weather_main = _dig(response, "weather", 0, "main", default="Clear")
 
     return {
-        "temp": response.get("main", {}).get("temp", 293.15),
-        "feels_like": response.get("main", {}).get("feels_like", 293.15),
-        "wind_speed": response.get("wind", {}).get("speed", 0),
-        "humidity": response.get("main", {}).get("humidity", 50),
+        "temp": _dig(response, "main", "temp", default=293.15),
+        "feels_like": _dig(response, "main", "feels_like", default=293.15),
+        "wind_speed": _dig(response, "wind", "speed", default=0),
+        "humidity": _dig(response, "main", "humidity", default=50),
         "precipitation": rain + snow,
-        "clouds": response.get("clouds", {}).get("all", 20),
+        "clouds": _dig(response, "clouds", "all", default=20),
         "visibility": response.get("visibility", 10000),
         "weather_main": weather_main,
         "description": weather_description,
         "location": location,
         "country": country,
-        "is_day": is_daytime(sunrise, sunset)
+        "sunrise": sunrise,
+        "sunset": sunset
     }
 
-def get_air_quality(lat, lon):
+@cached("aq", AIR_QUALITY_TTL)
+async def get_air_quality(lat, lon):
     """Fetch air quality data from OpenWeather API."""
-    url = f"http://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={OPENWEATHER_API_KEY}"
-    response = requests.get(url).json()
+    params = {"lat": lat, "lon": lon, **_BASE_PARAMS}
+    response = await _fetch_json("/data/2.5/air_pollution", params)
 
     logger.info(f"Fetching air quality data for {lat}, {lon}")
 
     if "list" not in response or not response["list"]:
-        logger.warning("⚠️ Air quality data missing. Assuming good air quality.")
-        return {"so2": 0, "no2": 0, "pm10": 0, "pm2_5": 0, "o3": 0, "co": 0}
+        return None
 
     pollutants = response["list"][0]["components"]
 
-    return {key: pollutants.get(key, 0) for key in ["so2", "no2", "pm10", "pm2_5", "o3", "co"]}
-
-def classify_air_quality(pollutants):
-    """Classify air quality using provided matrix."""
-    air_quality_matrix = {
-        "Good": {"so2": 20, "no2": 40, "pm10": 20, "pm2_5": 10, "o3": 60, "co": 4400},
-        "Fair": {"so2": 80, "no2": 70, "pm10": 50, "pm2_5": 25, "o3": 100, "co": 9400},
-        "Moderate": {"so2": 250, "no2": 150, "pm10": 100, "pm2_5": 50, "o3": 140, "co": 12400},
-        "Poor": {"so2": 350, "no2": 200, "pm10": 200, "pm2_5": 75, "o3": 180, "co": 15400},
-        "Very Poor": {"so2": float("inf"), "no2": float("inf"), "pm10": float("inf"), "pm2_5": float("inf"), "o3": float("inf"), "co": float("inf")}
-    }
-
-    for quality, limits in air_quality_matrix.items():
-        if any(pollutants[pollutant] >= limit for pollutant, limit in limits.items()):
-            return quality
+    return {key: pollutants.get(key, 0) for key in _POLLUTANTS}
 
-    return "Good"
-
-def classify_weather(weather_data, air_quality_category):
-    """Classify pet-friendly weather conditions, considering air quality."""
-    temp_c = weather_data["temp"] - 273.15
-    feels_like_c = weather_data["feels_like"] - 273.15
-    wind_kmh = weather_data["wind_speed"] * 3.6  # Convert m/s to km/h
-
-    if air_quality_category in ["Poor", "Very Poor"]:
-        return {
-            "recommendation": f"Take Precaution (Air Quality: {air_quality_category})",
-            "triggered_by": "Air Pollution",
-            "value": air_quality_category
-        }
+@njit(cache=True)
+def _classify(so2, no2, pm10, pm2_5, o3, co, temp_c, feels_like_c, wind_kmh, precipitation):
+    """Return (air quality index into _CATEGORIES, rule index into _RULES) for one reading."""
+    values = (so2, no2, pm10, pm2_5, o3, co)
+    air_quality = 0
+    for i in range(_THRESH.shape[0]):
+        hit = False
+        for j in range(_THRESH.shape[1]):
+            if values[j] >= _THRESH[i, j]:
+                hit = True
+                break
+        if hit:
+            air_quality = i
+            break
 
+    if air_quality >= _POOR:
+        return air_quality, 0
     if temp_c > 35 or temp_c < -5 or feels_like_c > 35 or feels_like_c < -5:
-        return {
-            "recommendation": "Do Not Go Out (Extreme Temperature)",
-            "triggered_by": "Temperature",
-            "value": f"{temp_c:.2f}°C / Feels Like: {feels_like_c:.2f}°C"
-        }
-
+        return air_quality, 1
     if wind_kmh > 40:
-        return {
-            "recommendation": "Do Not Go Out (High Wind Speed)",
-            "triggered_by": "Wind Speed",
-            "value": f"{wind_kmh:.2f} km/h"
-        }
-
-    if weather_data["precipitation"] > 5:
-        return {
-            "recommendation": "Do Not Go Out (Heavy Rain/Snow)",
-            "triggered_by": "Precipitation",
-            "value": f"{weather_data['precipitation']} mm"
-        }
-
+        return air_quality, 2
+    if precipitation > 5:
+        return air_quality, 3
     if temp_c < 0 or temp_c > 30 or feels_like_c < 0 or feels_like_c > 30:
-        return {
-            "recommendation": "Take Precaution (Temperature Warning)",
-            "triggered_by": "Temperature",
-            "value": f"{temp_c:.2f}°C / Feels Like: {feels_like_c:.2f}°C"
-        }
+        return air_quality, 4
+    return air_quality, 5
 
-    return {
-        "recommendation": "No Worries (Good Weather for a Walk)",
-        "triggered_by": "General Weather Conditions",
-        "value": "All parameters within safe range"
+def classify(temp_c, feels_like_c, wind_kmh, precipitation, pollutants):
+    """Classify air quality and pet-friendly weather conditions, considering air quality.
+
+    Returns (air_quality_category, recommendation, triggered_by, value).
+    """
+    air_quality, rule = _classify(
+        *(float(pollutants[p]) for p in _POLLUTANTS),
+        float(temp_c),
+        float(feels_like_c),
+        float(wind_kmh),
+        float(precipitation),
+    )
+    air_quality_category = _CATEGORIES[air_quality]
+    fields = {
+        "aq": air_quality_category,
+        "temp_c": temp_c,
+        "feels_like_c": feels_like_c,
+        "wind_kmh": wind_kmh,
+        "precipitation": precipitation,
     }
+    recommendation, triggered_by, value = _RULES[rule]
+    return air_quality_category, recommendation.format(**fields), triggered_by, value.format(**fields)
 
 @app.post("/check-weather")
-def check_weather(location: LocationData):
+async def check_weather(location: LocationData):
     """Fetch weather & air quality data dynamically and return classification."""
-    weather_data = get_weather_data(location.lat, location.lon)
-    pollutants = get_air_quality(location.lat, location.lon)
+    key = (round(location.lat, 2), round(location.lon, 2))
+
+    # Cached responses are stored already serialized, so hits skip JSON encoding entirely
+    body = await _cache_get(f"resp:{key[0]}:{key[1]}")
+    if body is None:
+        # Concurrent requests for the same ~1 km cell share a single upstream fetch
+        task = _inflight.get(key)
+        if task is None:
+            task = _inflight[key] = asyncio.ensure_future(_check_weather(location.lat, location.lon))
+            task.add_done_callback(functools.partial(_inflight_done, key))
+        # Shield so one client disconnecting doesn't cancel the fetch for the others
+        body = await asyncio.shield(task)
+    return Response(body, media_type="application/json")
+
+def _inflight_done(key, task):
+    """Forget a finished fetch and retrieve its exception in case every waiter was cancelled."""
+    _inflight.pop(key, None)
+    if not task.cancelled():
+        task.exception()
+
+async def _check_weather(lat, lon):
+    """Fetch weather & air quality data for a location and return the serialized classification."""
+    # Both OpenWeather calls are independent, so run them concurrently
+    weather_data, pollutants = await asyncio.gather(
+        get_weather_data(lat, lon),
+        get_air_quality(lat, lon),
+    )
 
     if not weather_data:
-        return {"error": "Failed to fetch weather data."}
+        return orjson.dumps({"error": "Failed to fetch weather data."})
 
-    air_quality_category = classify_air_quality(pollutants)
-    classification = classify_weather(weather_data, air_quality_category)
-    
-    # Convert Kelvin to Celsius for temperature values
+    if not pollutants:
+        logger.warning("⚠️ Air quality data missing. Assuming good air quality.")
+        pollutants = {"so2": 0, "no2": 0, "pm10": 0, "pm2_5": 0, "o3": 0, "co": 0}
+
+    # Worked out per request since weather data may come from a cache up to a day old
+    now_s = int(_now())  # OpenWeather timestamps are whole seconds
+    is_day = weather_data.get("sunrise", 0) <= now_s <= weather_data.get("sunset", 0)
+
+    # Unit conversions shared by the classifier and the response
     temp_c = weather_data["temp"] - 273.15
     feels_like_c = weather_data["feels_like"] - 273.15
-    
-    # Add additional fields needed by the WeatherCard component
-    classification.update({
-        "location": weather_data["location"],
-        "country": weather_data["country"],
-        "temp": round(temp_c, 1),
-        "feels_like": round(feels_like_c, 1),
-        "description": weather_data["description"],
-        "main": weather_data["weather_main"],
-        "humidity": weather_data["humidity"],
-        "wind_speed": round(weather_data["wind_speed"] * 3.6, 1),  # Convert m/s to km/h
-        "air_quality": air_quality_category,
-        "is_day": weather_data["is_day"]
-    })
-
-    return classification
\ No newline at end of file
+    wind_kmh = weather_data["wind_speed"] * 3.6  # Convert m/s to km/h
+
+    air_quality_category, recommendation, triggered_by, value = classify(
+        temp_c, feels_like_c, wind_kmh, weather_data["precipitation"], pollutants
+    )
+
+    response = WeatherResponse(
+        recommendation=recommendation,
+        triggered_by=triggered_by,
+        value=value,
+        location=weather_data["location"],
+        country=weather_data["country"],
+        temp=round(temp_c, 1),
+        feels_like=round(feels_like_c, 1),
+        description=weather_data["description"],
+        main=weather_data["weather_main"],
+        humidity=weather_data["humidity"],
+        wind_speed=round(wind_kmh, 1),
+        air_quality=air_quality_category,
+        is_day=is_day,
+        stale=weather_data.get("stale", False) or pollutants.get("stale", False),
+    )
+
+    # orjson serializes dataclasses natively, no asdict() copy needed
+    body = orjson.dumps(response)
+    # Only fresh results are cached; stale ones should be retried against the upstream
+    if not response.stale:
+        await _cache_set((f"resp:{round(lat, 2)}:{round(lon, 2)}", RESPONSE_TTL, body))
+    return body
\ No newline at end of file
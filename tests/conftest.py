@@ -0,0 +1,34 @@
+import os
+import sys
+
+# main.py refuses to import without an API key; the tests never reach the real API
+os.environ.setdefault("OPENWEATHER_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def breaker(monkeypatch):
+    breaker = main.CircuitBreaker(max_failures=5, reset_after=30)
+    monkeypatch.setattr(main, "_breaker", breaker)
+    return breaker
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """Replace Redis with a dict; TTLs are ignored, tests expire keys by hand."""
+    store = {}
+
+    async def cache_get(key):
+        return store.get(key)
+
+    async def cache_set(*entries):
+        for key, _ttl, body in entries:
+            store[key] = body
+
+    monkeypatch.setattr(main, "_cache_get", cache_get)
+    monkeypatch.setattr(main, "_cache_set", cache_set)
+    return store
@@ -0,0 +1,58 @@
+"""Tests for request coalescing and the serialized response cache on /check-weather."""
+import asyncio
+
+import httpx
+import orjson
+import pytest
+
+import main
+
+WEATHER = {
+    "cod": 200,
+    "name": "London",
+    "sys": {"country": "GB", "sunrise": 0, "sunset": 0},
+    "weather": [{"main": "Clouds", "description": "overcast clouds"}],
+    "main": {"temp": 283.15, "feels_like": 281.15, "humidity": 80},
+    "wind": {"speed": 4.0},
+}
+AIR = {"list": [{"components": {"so2": 1, "no2": 2, "pm10": 3, "pm2_5": 4, "o3": 5, "co": 200}}]}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    calls = []
+
+    def handler(request):
+        calls.append(request.url.path)
+        return httpx.Response(200, json=WEATHER if request.url.path.endswith("/weather") else AIR)
+
+    client = httpx.AsyncClient(base_url="https://api.openweathermap.org", transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(main.app.state, "client", client, raising=False)
+    monkeypatch.setattr(main.app.state, "upstream_sem", asyncio.Semaphore(30), raising=False)
+    yield calls
+    asyncio.run(client.aclose())
+
+
+def check_weather(n):
+    async def run():
+        location = main.LocationData(lat=51.5, lon=-0.12)
+        return await asyncio.gather(*(main.check_weather(location) for _ in range(n)))
+    return [response.body for response in asyncio.run(run())]
+
+
+def test_concurrent_requests_share_one_upstream_fetch(breaker, store, upstream):
+    bodies = check_weather(10)
+    assert sorted(upstream) == ["/data/2.5/air_pollution", "/data/2.5/weather"]
+    assert len(set(bodies)) == 1
+    assert orjson.loads(bodies[0])["location"] == "London"
+    assert main._inflight == {}
+
+
+def test_cached_response_is_served_without_upstream_calls(breaker, store, upstream):
+    [body] = check_weather(1)
+    assert store["resp:51.5:-0.12"] == body
+
+    # Drop the per-endpoint caches so only the response cache can avoid a refetch
+    del store["wx:51.5:-0.12"], store["aq:51.5:-0.12"]
+    assert check_weather(1) == [body]
+    assert len(upstream) == 2
@@ -0,0 +1,116 @@
+"""Tests for the OpenWeather circuit breaker and its stale-cache fallback."""
+import asyncio
+
+import httpx
+import pytest
+
+import main
+
+KEY = "wx:51.5:-0.12"
+
+WEATHER = {
+    "cod": 200,
+    "name": "London",
+    "sys": {"country": "GB", "sunrise": 0, "sunset": 0},
+    "weather": [{"main": "Clouds", "description": "overcast clouds"}],
+    "main": {"temp": 283.15, "feels_like": 281.15, "humidity": 80},
+    "wind": {"speed": 4.0},
+}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class Upstream:
+    """MockTransport handler whose response the test can swap, counting calls."""
+
+    def __init__(self):
+        self.response = httpx.Response(200, json=WEATHER)
+        self.calls = 0
+
+    def __call__(self, request):
+        self.calls += 1
+        return self.response
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(main, "monotonic", clock)
+    return clock
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = Upstream()
+    client = httpx.AsyncClient(base_url="https://api.openweathermap.org", transport=httpx.MockTransport(upstream))
+    monkeypatch.setattr(main.app.state, "client", client, raising=False)
+    monkeypatch.setattr(main.app.state, "upstream_sem", asyncio.Semaphore(1), raising=False)
+    yield upstream
+    asyncio.run(client.aclose())
+
+
+def fetch():
+    return asyncio.run(main.get_weather_data(51.5, -0.12))
+
+
+def test_breaker_opens_serves_stale_then_half_opens(clock, breaker, store, upstream):
+    assert fetch()["location"] == "London"
+    del store[KEY]
+
+    upstream.response = httpx.Response(502, text="<html>Bad Gateway</html>")
+    for _ in range(5):
+        assert fetch()["stale"] is True
+    assert breaker.is_open
+    assert upstream.calls == 6
+
+    # While open the upstream is skipped entirely
+    assert fetch()["stale"] is True
+    assert upstream.calls == 6
+
+    # After the cool-down a single probe goes through and closes the circuit on success
+    clock.now += 30
+    upstream.response = httpx.Response(200, json=WEATHER)
+    data = fetch()
+    assert "stale" not in data
+    assert upstream.calls == 7
+    assert not breaker.is_open
+    assert breaker.failures == 0
+
+
+def test_half_open_reopens_on_next_failure(clock, breaker, store, upstream):
+    upstream.response = httpx.Response(502, text="<html>Bad Gateway</html>")
+    for _ in range(5):
+        fetch()
+    clock.now += 30
+    assert not breaker.is_open
+
+    fetch()
+    assert breaker.is_open
+
+
+def test_rate_limit_counts_as_failure(clock, breaker, store, upstream):
+    upstream.response = httpx.Response(429, json={"cod": 429, "message": "Too many requests"})
+    for _ in range(5):
+        assert fetch() is None
+    assert breaker.is_open
+
+
+def test_client_error_neither_trips_nor_resets(clock, breaker, store, upstream):
+    breaker.failures = 3
+    upstream.response = httpx.Response(400, json={"cod": "400", "message": "wrong latitude"})
+    assert fetch() is None
+    assert breaker.failures == 3
+    assert not breaker.is_open
+
+
+def test_upstream_errors_are_logged_without_the_api_key(clock, breaker, store, upstream, caplog):
+    upstream.response = httpx.Response(503, text="Service Unavailable")
+    fetch()
+    assert "HTTPStatusError 503" in caplog.text
+    assert "appid" not in caplog.text
@@ -0,0 +1,72 @@
+"""Tests for the pet-walk classifier, pinned to the original classify_air_quality/classify_weather output."""
+import pytest
+
+import main
+
+CLEAN_AIR = {"so2": 0, "no2": 0, "pm10": 0, "pm2_5": 0, "o3": 0, "co": 0}
+
+NO_WORRIES = ("No Worries (Good Weather for a Walk)", "General Weather Conditions", "All parameters within safe range")
+
+
+def temperature(recommendation, temp_c, feels_like_c):
+    return (recommendation, "Temperature", f"{temp_c:.2f}°C / Feels Like: {feels_like_c:.2f}°C")
+
+
+def extreme(temp_c, feels_like_c):
+    return temperature("Do Not Go Out (Extreme Temperature)", temp_c, feels_like_c)
+
+
+def warning(temp_c, feels_like_c):
+    return temperature("Take Precaution (Temperature Warning)", temp_c, feels_like_c)
+
+
+@pytest.mark.parametrize("temp_c, feels_like_c, wind_kmh, precipitation, expected", [
+    (20.0, 20.0, 0.0, 0, NO_WORRIES),
+    # Extreme temperature: strictly above 35 or below -5, on either reading
+    (35.0, 20.0, 0.0, 0, warning(35.0, 20.0)),
+    (35.01, 20.0, 0.0, 0, extreme(35.01, 20.0)),
+    (-5.0, 20.0, 0.0, 0, warning(-5.0, 20.0)),
+    (-5.01, 20.0, 0.0, 0, extreme(-5.01, 20.0)),
+    (20.0, 35.01, 0.0, 0, extreme(20.0, 35.01)),
+    (20.0, -5.01, 0.0, 0, extreme(20.0, -5.01)),
+    # Temperature warning: strictly above 30 or below 0, on either reading
+    (30.0, 30.0, 0.0, 0, NO_WORRIES),
+    (30.01, 20.0, 0.0, 0, warning(30.01, 20.0)),
+    (0.0, 0.0, 0.0, 0, NO_WORRIES),
+    (-0.01, 20.0, 0.0, 0, warning(-0.01, 20.0)),
+    (20.0, -0.01, 0.0, 0, warning(20.0, -0.01)),
+    # Wind: strictly above 40 km/h
+    (20.0, 20.0, 40.0, 0, NO_WORRIES),
+    (20.0, 20.0, 40.01, 0, ("Do Not Go Out (High Wind Speed)", "Wind Speed", "40.01 km/h")),
+    # Precipitation: strictly above 5 mm, shown as given
+    (20.0, 20.0, 0.0, 5, NO_WORRIES),
+    (20.0, 20.0, 0.0, 5.5, ("Do Not Go Out (Heavy Rain/Snow)", "Precipitation", "5.5 mm")),
+    (20.0, 20.0, 0.0, 6, ("Do Not Go Out (Heavy Rain/Snow)", "Precipitation", "6 mm")),
+    # Rules apply in priority order
+    (40.0, 40.0, 50.0, 10, extreme(40.0, 40.0)),
+    (20.0, 20.0, 50.0, 10, ("Do Not Go Out (High Wind Speed)", "Wind Speed", "50.00 km/h")),
+    (31.0, 31.0, 0.0, 10, ("Do Not Go Out (Heavy Rain/Snow)", "Precipitation", "10 mm")),
+])
+def test_weather_rules(temp_c, feels_like_c, wind_kmh, precipitation, expected):
+    assert main.classify(temp_c, feels_like_c, wind_kmh, precipitation, CLEAN_AIR) == ("Good", *expected)
+
+
+@pytest.mark.parametrize("pollutant", main._POLLUTANTS)
+@pytest.mark.parametrize("row", range(len(main._CATEGORIES) - 1))
+@pytest.mark.parametrize("offset", [-0.01, 0.0])
+def test_pollutant_limits(pollutant, row, offset):
+    # Like the original loop, the scan returns the first category with any pollutant at or
+    # above its limit. Every limit is at least the "Good" one, so each reading lands in "Good"
+    limit = main._THRESH[row, main._POLLUTANTS.index(pollutant)]
+    pollutants = {**CLEAN_AIR, pollutant: limit + offset}
+    assert main.classify(20.0, 20.0, 0.0, 0, pollutants) == ("Good", *NO_WORRIES)
+
+
+@pytest.mark.parametrize("air_quality", [main._POOR, main._POOR + 1])
+def test_air_pollution_rule_decoding(monkeypatch, air_quality):
+    # Unreachable through the threshold table above, so check the decoding on its own
+    monkeypatch.setattr(main, "_classify", lambda *reading: (air_quality, 0))
+    category = main._CATEGORIES[air_quality]
+    assert main.classify(20.0, 20.0, 0.0, 0, CLEAN_AIR) == (
+        category, f"Take Precaution (Air Quality: {category})", "Air Pollution", category
+    )